@@ -1,62 +1,133 @@
 import argparse
+import concurrent.futures
 import dataclasses
+import errno
+import fcntl
 import hashlib
+import io
 import os
 import pathlib
+import re
 import shutil
+import stat
 import subprocess
 import sys
+import tarfile
 import tempfile
+import threading
 import typing
+import uuid
+import zipfile
 
+import orjson
 import requests
+import requests.adapters
 import structlog
 import tenacity
-from dataclasses_json import dataclass_json
+import urllib3
+
+try:
+    import zstandard
+except ImportError:
+    # zstandardがない場合は、tarコマンド（zstdコマンド）で展開する
+    zstandard = None
 
 logger = structlog.get_logger()
 
+# ストリーム展開に対応するTAR形式の拡張子と、tarコマンドの圧縮形式オプション
+TAR_COMPRESSION_OPTIONS = {
+    "tar": [],
+    "tar.gz": ["--gzip"],
+    "tar.bz2": ["--bzip2"],
+    "tar.xz": ["--xz"],
+    "tar.zst": ["--zstd"],
+}
+# バックグラウンドで削除中のディレクトリ名に付ける文字列（<name>.deleting.<pid>.<uuid>）
+REMOVING_DIR_INFIX = ".deleting."
+REMOVING_DIR_PATTERN = re.compile(rf".+{re.escape(REMOVING_DIR_INFIX)}\d+\.[0-9a-f]{{32}}")
+# スナップショット(tar.gz)をダウンロードできるホスティングサービスのURL
+SNAPSHOT_HOST_PATTERN = re.compile(
+    r"^https://(?P<host>github\.com|gitlab\.com|codeberg\.org)/(?P<owner>[^/]+)/(?P<repo>[^/]+?)(?:\.git)?/?$"
+)
+# 省略されていないcommit id
+COMMIT_ID_PATTERN = re.compile(r"^[0-9a-f]{40}$")
+
+
+def create_http_session(pool_size: int = 16) -> requests.Session:
+    """コネクションを再利用するHTTPセッションを生成"""
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(
+        pool_connections=pool_size,
+        pool_maxsize=pool_size,
+        max_retries=urllib3.Retry(total=3, backoff_factor=0.3, status_forcelist=[502, 503, 504]),
+    )
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
 
-@dataclass_json
 @dataclasses.dataclass
 class GitSpec:
     url: str
     ref: typing.Optional[str] = None
     depth: typing.Optional[int] = None
 
+    @staticmethod
+    def from_dict(d: dict) -> "GitSpec":
+        return GitSpec(url=d["url"], ref=d.get("ref"), depth=d.get("depth"))
+
 
-@dataclass_json
 @dataclasses.dataclass
 class HashSpec:
     algorithm: typing.Literal["sha1", "sha256"]
     value: str
 
+    @staticmethod
+    def from_dict(d: dict) -> "HashSpec":
+        return HashSpec(algorithm=d["algorithm"], value=d["value"])
+
 
-@dataclass_json
 @dataclasses.dataclass
 class ArchiveFileSpec:
     url: str
     extension: typing.Optional[str] = None
     digest: typing.Optional[HashSpec] = None
 
+    @staticmethod
+    def from_dict(d: dict) -> "ArchiveFileSpec":
+        digest = d.get("digest")
+        return ArchiveFileSpec(
+            url=d["url"],
+            extension=d.get("extension"),
+            digest=HashSpec.from_dict(digest) if digest is not None else None,
+        )
+
 
-@dataclass_json
 @dataclasses.dataclass
 class Project:
     name: str
     git: typing.Optional[GitSpec] = None
     archive: typing.Optional[ArchiveFileSpec] = None
 
+    @staticmethod
+    def from_dict(d: dict) -> "Project":
+        git = d.get("git")
+        archive = d.get("archive")
+        return Project(
+            name=d["name"],
+            git=GitSpec.from_dict(git) if git is not None else None,
+            archive=ArchiveFileSpec.from_dict(archive) if archive is not None else None,
+        )
+
+    def to_json(self) -> bytes:
+        return orjson.dumps(dataclasses.asdict(self), option=orjson.OPT_INDENT_2)
 
-@dataclass_json
-@dataclasses.dataclass
-class ProjectDefsJson:
-    projects: typing.List[Project]
 
+class ProjectDefsJson:
     @staticmethod
-    def parse(json_str: str) -> typing.Dict[str, Project]:
-        project_defs = ProjectDefsJson.from_json(json_str)
-        return {project.name: project for project in project_defs.projects}
+    def parse(json_str: typing.Union[str, bytes]) -> typing.Dict[str, Project]:
+        raw = orjson.loads(json_str)
+        return {p["name"]: Project.from_dict(p) for p in raw["projects"]}
 
 
 class OpenGrokAPIClient:
@@ -64,16 +135,23 @@ class OpenGrokAPIClient:
 
     def __init__(self, url: str):
         self.url = url
+        self.session = create_http_session()
+        # 最後に取得した設定ファイルのETagと内容
+        self._configuration_cache: typing.Optional[tuple[str, bytes]] = None
+
+    def close(self):
+        """HTTPセッションを閉じる"""
+        self.session.close()
 
     def get_project_names(self) -> list[str]:
         """OpenGrok APIからプロジェクト名のリストを取得"""
-        response = requests.get(f"{self.url}/projects")
+        response = self.session.get(f"{self.url}/projects")
         response.raise_for_status()
         return response.json()
 
     def add_project(self, project_name: str):
         """OpenGrok APIにプロジェクトを追加"""
-        response = requests.post(
+        response = self.session.post(
             f"{self.url}/projects",
             headers={"Content-Type": "text/plain"},
             data=project_name
@@ -82,29 +160,81 @@ class OpenGrokAPIClient:
 
     def delete_project(self, project_name: str):
         """OpenGrok APIからプロジェクトを削除"""
-        response = requests.delete(f"{self.url}/projects/{project_name}")
+        response = self.session.delete(f"{self.url}/projects/{project_name}")
         response.raise_for_status()
 
     def get_configuration(self) -> bytes:
-        """OpenGrok APIから設定ファイルを取得"""
-        response = requests.get(f"{self.url}/configuration")
+        """OpenGrok APIから設定ファイルを取得
+
+        ETagが返された場合は内容をキャッシュし、次回以降は変更がなければキャッシュを返す。
+        """
+        headers = {}
+        if self._configuration_cache is not None:
+            headers["If-None-Match"] = self._configuration_cache[0]
+        response = self.session.get(f"{self.url}/configuration", headers=headers)
+        if response.status_code == 304 and self._configuration_cache is not None:
+            return self._configuration_cache[1]
         response.raise_for_status()
+
+        etag = response.headers.get("ETag")
+        self._configuration_cache = (etag, response.content) if etag else None
         return response.content
 
 
+@dataclasses.dataclass
+class ProjectIndexEntry:
+    """projects_index.jsonのエントリ"""
+    project: Project
+    # 読み込んだ時点のproject.jsonのmtimeとサイズ。project.jsonが更新されていないかの確認に使う
+    mtime_ns: int
+    size: int
+
+    @staticmethod
+    def from_dict(d: dict) -> "ProjectIndexEntry":
+        return ProjectIndexEntry(project=Project.from_dict(d["project"]), mtime_ns=d["mtime_ns"], size=d["size"])
+
+
 class ProjectJsonManager:
     """project.jsonファイルの読み書き操作を担当するクラス"""
 
     def __init__(self, data_dir: pathlib.Path, src_dir: pathlib.Path):
         self.data_dir = data_dir
         self.src_dir = src_dir  # マイグレーション専用（将来的に廃止予定）
+        # マイグレーション済みのプロジェクト名。1回の実行中に同じプロジェクトを何度も確認しないようにする
+        self._migrated: set[str] = set()
+        # マイグレーション対象の古いファイルの一覧（初回のマイグレーション時に作成）
+        self._legacy_paths: typing.Optional[set[pathlib.Path]] = None
+        self._migration_lock = threading.Lock()
+        # 全プロジェクトのproject.jsonをまとめたインデックス（初回のアクセス時に読み込む）
+        self._index: typing.Optional[dict[str, ProjectIndexEntry]] = None
+        self._index_lock = threading.Lock()
 
     def _get_project_json_path(self, project_name: str) -> pathlib.Path:
         """project.jsonファイルのパスを生成"""
         return self.data_dir / project_name / "project.json"
 
+    def _scan_legacy_paths(self) -> set[pathlib.Path]:
+        """マイグレーション対象の古いproject.jsonファイルを列挙"""
+        legacy_paths = set()
+        for directory in (self.src_dir, self.data_dir):
+            try:
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        if entry.name.endswith(".project.json") and entry.is_file():
+                            legacy_paths.add(directory / entry.name)
+            except FileNotFoundError:
+                continue
+        return legacy_paths
+
     def migrate_project(self, project_name: str):
         """project.jsonファイルのマイグレーションを実行。"""
+        with self._migration_lock:
+            if project_name in self._migrated:
+                return
+            if self._legacy_paths is None:
+                self._legacy_paths = self._scan_legacy_paths()
+            legacy_paths = self._legacy_paths
+
         new_path = self._get_project_json_path(project_name)
 
         # マイグレーション対象の古いパスを定義
@@ -114,7 +244,7 @@ class ProjectJsonManager:
         ]
 
         for old_path in migration_sources:
-            if not old_path.exists():
+            if old_path not in legacy_paths:
                 continue
 
             try:
@@ -122,7 +252,13 @@ class ProjectJsonManager:
                     # 移動先のディレクトリを作成
                     new_path.parent.mkdir(parents=True, exist_ok=True)
                     # ファイルを移動
-                    shutil.move(str(old_path), str(new_path))
+                    try:
+                        os.replace(old_path, new_path)
+                    except OSError as e:
+                        # src_dirとdata_dirは別ボリュームの場合があるため、その場合はコピーして移動する
+                        if e.errno != errno.EXDEV:
+                            raise
+                        shutil.move(str(old_path), str(new_path))
                     logger.info("Migrated project.json", project_name=project_name,
                                 from_path=str(old_path),
                                 to_path=str(new_path))
@@ -134,44 +270,300 @@ class ProjectJsonManager:
             except Exception as e:
                 raise Exception(f"Failed to migrate project.json from {old_path} to {new_path}") from e
 
-    def load_project(self, project_name: str) -> typing.Optional[Project]:
-        """project.jsonファイルからプロジェクト情報を読み込む"""
+        with self._migration_lock:
+            for old_path in migration_sources:
+                legacy_paths.discard(old_path)
+            self._migrated.add(project_name)
+
+    def _get_index_path(self) -> pathlib.Path:
+        """インデックスファイルのパスを生成"""
+        return self.data_dir / "projects_index.json"
+
+    def _read_index(self) -> typing.Optional[dict[str, ProjectIndexEntry]]:
+        """インデックスファイルを読み込む。存在しない、もしくは不正な場合はNone"""
+        index_path = self._get_index_path()
+        try:
+            raw = orjson.loads(index_path.read_bytes())
+            return {name: ProjectIndexEntry.from_dict(d) for name, d in raw.items()}
+        except FileNotFoundError:
+            return None
+        except Exception:
+            logger.warning("Ignoring invalid projects index", path=str(index_path))
+            return None
+
+    def _write_index(self, index: dict[str, ProjectIndexEntry]):
+        """インデックスファイルをアトミックに書き込む"""
+        index_path = self._get_index_path()
+        index_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = index_path.with_name(f"{index_path.name}.{os.getpid()}.tmp")
+        tmp_path.write_bytes(orjson.dumps(
+            {name: dataclasses.asdict(entry) for name, entry in index.items()},
+            option=orjson.OPT_INDENT_2,
+        ))
+        os.replace(tmp_path, index_path)
+
+    def _stat_project_json(self, project_name: str) -> typing.Optional[tuple[int, int]]:
+        """project.jsonのmtimeとサイズを取得。存在しない場合はNone"""
+        try:
+            st = os.stat(self._get_project_json_path(project_name))
+        except FileNotFoundError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def _load_index_entry(self, project_name: str) -> typing.Optional[ProjectIndexEntry]:
+        """project.jsonを読み込み、インデックスのエントリを作成"""
+        self.migrate_project(project_name)
+        # 読み込み中に更新された場合でも次回に再読み込みされるように、読み込む前にstatする
+        stat = self._stat_project_json(project_name)
+        if stat is None:
+            return None
+        project = self._load_project_file(project_name)
+        if project is None:
+            return None
+        return ProjectIndexEntry(project=project, mtime_ns=stat[0], size=stat[1])
+
+    def _rebuild_index(self) -> dict[str, ProjectIndexEntry]:
+        """各プロジェクトのproject.jsonからインデックスを再作成"""
+        index = {}
+        try:
+            with os.scandir(self.data_dir) as entries:
+                project_names = [entry.name for entry in entries
+                                 if entry.is_dir() and not entry.name.startswith(".")]
+        except FileNotFoundError:
+            project_names = []
+        for project_name in project_names:
+            entry = self._load_index_entry(project_name)
+            if entry is not None:
+                index[project_name] = entry
+        self._write_index(index)
+        logger.info("Rebuilt projects index", project_count=len(index))
+        return index
+
+    def _refresh_index(self, index: dict[str, ProjectIndexEntry]):
+        """project.jsonのmtimeとサイズを確認し、食い違っているエントリを読み込み直す"""
+        changed = False
+        for project_name, entry in list(index.items()):
+            if self._stat_project_json(project_name) == (entry.mtime_ns, entry.size):
+                continue
+            changed = True
+            new_entry = self._load_index_entry(project_name)
+            if new_entry is None:
+                del index[project_name]
+            else:
+                index[project_name] = new_entry
+        if changed:
+            self._write_index(index)
+            logger.info("Refreshed projects index", project_count=len(index))
+
+    def _update_index(self, project_name: str, entry: typing.Optional[ProjectIndexEntry]):
+        """インデックスのエントリを更新。entryがNoneの場合は削除"""
+        with self._index_lock:
+            if self._index is None:
+                self._index = self._read_index() or {}
+            if self._index.get(project_name) == entry:
+                return
+            if entry is None:
+                del self._index[project_name]
+            else:
+                self._index[project_name] = entry
+            self._write_index(self._index)
+
+    def load_all(self) -> dict[str, Project]:
+        """インデックスファイルから全プロジェクトの情報を読み込む
+
+        インデックスファイルが存在しない場合は、各プロジェクトのproject.jsonから再作成する。
+        project.jsonが更新・削除されていた場合は、該当するエントリのみ読み込み直す。
+        インデックスにないプロジェクトはload_projectで個別に読み込むこと。
+        """
+        with self._index_lock:
+            if self._index is None:
+                index = self._read_index()
+                if index is None:
+                    index = self._rebuild_index()
+                else:
+                    self._refresh_index(index)
+                self._index = index
+            return {name: entry.project for name, entry in self._index.items()}
+
+    def _load_project_file(self, project_name: str) -> typing.Optional[Project]:
+        """project.jsonファイルからプロジェクト情報を読み込む（インデックスは更新しない）"""
         self.migrate_project(project_name)
         project_json_path = self._get_project_json_path(project_name)
         if not project_json_path.exists():
             return None
 
         try:
-            with open(project_json_path, "r") as f:
-                project = Project.from_json(f.read())
+            with open(project_json_path, "rb") as f:
+                project = Project.from_dict(orjson.loads(f.read()))
                 if project.name != project_name:
                     raise ValueError(f"Project name mismatch: {project.name} != {project_name}")
                 return project
         except Exception:
             return None
 
+    def load_project(self, project_name: str) -> typing.Optional[Project]:
+        """project.jsonファイルからプロジェクト情報を読み込む"""
+        entry = self._load_index_entry(project_name)
+        # インデックスがproject.jsonと異なっていた場合は修正する
+        self._update_index(project_name, entry)
+        return entry.project if entry is not None else None
+
     def save_project(self, project: Project):
         """project.jsonファイルにプロジェクト情報を保存"""
         self.migrate_project(project.name)
         project_json_path = self._get_project_json_path(project.name)
         project_json_path.parent.mkdir(parents=True, exist_ok=True)
-        with open(project_json_path, "w") as f:
-            f.write(project.to_json(indent=2))
+        with open(project_json_path, "wb") as f:
+            f.write(project.to_json())
+        stat = self._stat_project_json(project.name)
+        self._update_index(project.name, ProjectIndexEntry(project=project, mtime_ns=stat[0], size=stat[1]))
 
     def delete_project(self, project_name: str):
         """project.jsonファイルを削除"""
         self.migrate_project(project_name)
         project_json_path = self._get_project_json_path(project_name)
         project_json_path.unlink(missing_ok=True)
+        self._update_index(project_name, None)
+
+
+class GitMirrorCache:
+    """リモートリポジトリのベアミラーをキャッシュするクラス
+
+    同じURLのリポジトリは1つのミラーを共有し、作業ツリーはミラーを参照してcloneする。
+    """
+
+    def __init__(self, cache_dir: pathlib.Path):
+        self.cache_dir = cache_dir
+
+    def _get_mirror_path(self, url: str) -> pathlib.Path:
+        """ミラーリポジトリのパスを生成"""
+        key = hashlib.sha1(url.encode()).hexdigest()
+        return self.cache_dir / f"{key}.git"
+
+    def ensure(self, url: str) -> pathlib.Path:
+        """ミラーリポジトリを作成または更新し、そのパスを返す"""
+        mirror_path = self._get_mirror_path(url)
+        lock_path = mirror_path.with_suffix(".lock")
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+        # 同じURLを複数のプロジェクトから同時に更新しないようにロックする
+        with open(lock_path, "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            if (mirror_path / "HEAD").exists():
+                subprocess.run(
+                    ["git", "-C", str(mirror_path), "remote", "update", "--prune"],
+                    check=True,
+                    stdin=subprocess.DEVNULL,
+                    stdout=sys.stdout,
+                    stderr=sys.stderr,
+                )
+            else:
+                if mirror_path.exists():
+                    shutil.rmtree(mirror_path)
+                try:
+                    subprocess.run(
+                        ["git", "clone", "--mirror", url, str(mirror_path)],
+                        check=True,
+                        stdin=subprocess.DEVNULL,
+                        stdout=sys.stdout,
+                        stderr=sys.stderr,
+                    )
+                except Exception:
+                    # 中途半端なミラーが残らないように削除する
+                    shutil.rmtree(mirror_path, ignore_errors=True)
+                    raise
+        return mirror_path
+
+
+class ResponseReader(io.RawIOBase):
+    """HTTPレスポンスのチャンクを読み込み可能なファイルオブジェクトとして扱うクラス
+
+    hash_objが指定されている場合は、読み込んだデータでハッシュ値を更新する。
+    """
+
+    def __init__(self, response: requests.Response, hash_obj: typing.Optional["hashlib._Hash"]):
+        self._chunks = response.iter_content(chunk_size=1 << 20)
+        self._hash_obj = hash_obj
+        self._buffer = b""
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        if not self._buffer:
+            self._buffer = next(self._chunks, b"")
+            if self._hash_obj is not None:
+                self._hash_obj.update(self._buffer)
+        size = min(len(b), len(self._buffer))
+        b[:size] = self._buffer[:size]
+        self._buffer = self._buffer[size:]
+        return size
+
+
+@dataclasses.dataclass
+class DirectoryState:
+    """ダウンロード先ディレクトリの状態"""
+    exists: bool
+    is_git: bool
+
+    @staticmethod
+    def probe(path: pathlib.Path) -> "DirectoryState":
+        """1回のscandirでディレクトリの状態を取得"""
+        try:
+            with os.scandir(path) as entries:
+                is_git = any(entry.name == ".git" for entry in entries)
+        except FileNotFoundError:
+            return DirectoryState(exists=False, is_git=False)
+        except NotADirectoryError:
+            return DirectoryState(exists=True, is_git=False)
+        return DirectoryState(exists=True, is_git=is_git)
 
 
 class SourceCodeDownloader:
     """ソースコードのダウンロードを担当するクラス"""
 
-    def __init__(self, src_dir: pathlib.Path, data_dir: pathlib.Path, json_manager: ProjectJsonManager):
+    def __init__(self, src_dir: pathlib.Path, data_dir: pathlib.Path, json_manager: ProjectJsonManager,
+                 git_mirror_cache: GitMirrorCache):
         self.src_dir = src_dir
         self.data_dir = data_dir
         self.json_manager = json_manager
+        self.git_mirror_cache = git_mirror_cache
+        self.session = create_http_session()
+        # バックグラウンドでディレクトリを削除しているスレッド
+        self._removal_threads: list[threading.Thread] = []
+
+        # 前回の実行で削除しきれなかったディレクトリを削除する
+        # プロジェクト名は任意の文字列のため、_remove_dirが付けた名前と完全に一致するものだけを対象とする
+        try:
+            with os.scandir(self.src_dir) as entries:
+                removal_paths = [pathlib.Path(entry.path) for entry in entries
+                                 if REMOVING_DIR_PATTERN.fullmatch(entry.name)]
+        except FileNotFoundError:
+            removal_paths = []
+        for path in removal_paths:
+            self._start_removal(path)
+
+    def close(self):
+        """HTTPセッションを閉じ、バックグラウンドでの削除が完了するまで待つ"""
+        self.session.close()
+        for thread in self._removal_threads:
+            thread.join()
+        self._removal_threads.clear()
+
+    def _remove_dir(self, path: pathlib.Path):
+        """ディレクトリを削除
+
+        削除には時間がかかるため、別名に変更してからバックグラウンドで削除する。
+        """
+        victim = path.with_name(f"{path.name}{REMOVING_DIR_INFIX}{os.getpid()}.{uuid.uuid4().hex}")
+        os.replace(path, victim)
+        self._start_removal(victim)
+
+    def _start_removal(self, path: pathlib.Path):
+        """バックグラウンドでディレクトリの削除を開始"""
+        thread = threading.Thread(target=shutil.rmtree, args=(path,), kwargs={"ignore_errors": True}, daemon=True)
+        thread.start()
+        self._removal_threads.append(thread)
 
     def download(self, project: Project) -> bool:
         """プロジェクトのソースコードをダウンロード
@@ -180,16 +572,17 @@ class SourceCodeDownloader:
             bool: 変更があった場合はTrue、変更がなかった場合はFalse
         """
         target_dir = self.src_dir / project.name
+        state = DirectoryState.probe(target_dir)
 
         # git, archiveの順で確認し、最初に見つかったものを使用
         if project.git is not None:
-            return self._download_git(project, target_dir)
+            return self._download_git(project, target_dir, state)
         elif project.archive is not None:
-            return self._download_archive(project, target_dir)
+            return self._download_archive(project, target_dir, state)
         else:
             raise ValueError(f"Project {project.name} has no git or archive specification")
 
-    def _download_git(self, project: Project, target_dir: pathlib.Path) -> bool:
+    def _download_git(self, project: Project, target_dir: pathlib.Path, state: DirectoryState) -> bool:
         """Git形式でソースコードをダウンロード
         
         Returns:
@@ -199,19 +592,51 @@ class SourceCodeDownloader:
         if git_spec is None:
             raise ValueError(f"Project {project.name} has no git specification")
 
-        # 既存リポジトリを使用するかどうかを判定
+        # 以前のProject情報を読み込む
         old_project = self.json_manager.load_project(project.name)
-        use_existing_repo = (
-                target_dir.exists()
-                and (target_dir / ".git").exists()
-                and old_project == project
-        )
+
+        if state.exists and not state.is_git and old_project == project:
+            # .gitがないディレクトリはスナップショットから展開したもの。refが同じであれば内容も変化しない
+            return False
+
+        # 固定されたrefの場合は、git cloneより高速なスナップショットのダウンロードを試す
+        snapshot_spec = self._try_snapshot_url(git_spec)
+        if snapshot_spec is not None:
+            if state.exists:
+                self._remove_dir(target_dir)
+                state = DirectoryState(exists=False, is_git=False)
+            try:
+                self._extract_archive(project.name, snapshot_spec, target_dir, strip_components=1)
+                return True
+            except Exception as e:
+                logger.warning("Failed to download snapshot, falling back to git clone",
+                               project_name=project.name, url=snapshot_spec.url, exception=str(e))
+
+        # refが固定されている場合は履歴が不要なため、depth未指定でもshallow cloneする
+        depth = git_spec.depth
+        if depth is None and git_spec.ref:
+            depth = 1
+        # ミラーは全履歴を持つため、shallow cloneの場合は使用しない
+        use_mirror = depth is None
+
+        # 既存リポジトリを使用するかどうかを判定
+        use_existing_repo = state.is_git and old_project == project
 
         if use_existing_repo:
-            # 既存ディレクトリがある場合: git fetch && git reset --hard origin/<ref>
+            # 既存ディレクトリがある場合: git fetch <ref> && git reset --hard FETCH_HEAD
             # fetch前のHEAD commit idを取得
+            old_commit_id = self._read_head_commit_id(target_dir)
+
+            ref = git_spec.ref or "HEAD"
+
+            # リモートのcommit idがローカルと同じであれば、fetchせずに終了する
+            # ls-remoteのパターンは後方一致（mainはrefs/heads/x/mainにも一致する）ため、
+            # git fetchと同じ規則で解決されるrefの名前を明示して問い合わせる
+            candidate_refs = self._remote_ref_candidates(ref)
+            # 注釈付きタグの参照先commit（^{}）は、パターンに含めないと出力されない
+            peeled_refs = [f"{name}^{{}}" for name in candidate_refs if name.startswith("refs/tags/")]
             result = subprocess.run(
-                ["git", "rev-parse", "HEAD"],
+                ["git", "ls-remote", "origin", *candidate_refs, *peeled_refs],
                 cwd=target_dir,
                 check=True,
                 stdin=subprocess.DEVNULL,
@@ -219,70 +644,72 @@ class SourceCodeDownloader:
                 stderr=sys.stderr,
                 text=True,
             )
-            old_commit_id = result.stdout.strip()
+            remote_refs = {}
+            for line in result.stdout.splitlines():
+                commit_id, _, name = line.partition("\t")
+                remote_refs[name] = commit_id
+            if old_commit_id == self._resolve_remote_ref(remote_refs, candidate_refs):
+                return False
 
+            # refを明示してfetchし、FETCH_HEADにresetする（タグかブランチかを判定する必要がない）
+            if use_mirror:
+                # ミラーを更新し、差分はミラーからローカルに取得する
+                mirror_path = self.git_mirror_cache.ensure(git_spec.url)
+                fetch_cmd = ["git", "fetch", str(mirror_path), ref]
+            else:
+                # shallowな状態を維持したまま取得する
+                fetch_cmd = ["git", "fetch", "--depth", str(depth), "origin", ref]
             subprocess.run(
-                ["git", "fetch", "origin"],
+                fetch_cmd,
                 cwd=target_dir,
                 check=True,
                 stdin=subprocess.DEVNULL,
                 stdout=sys.stdout,
                 stderr=sys.stderr,
             )
-            # fetch後、refがタグかブランチかを判定して適切にresetする
-            ref = git_spec.ref or "HEAD"
-
-            # まずタグとして試す
-            result = subprocess.run(
-                ["git", "rev-parse", "--verify", f"refs/tags/{ref}"],
+            subprocess.run(
+                ["git", "reset", "--hard", "FETCH_HEAD"],
                 cwd=target_dir,
-                capture_output=True,
+                check=True,
+                stdin=subprocess.DEVNULL,
+                stdout=sys.stdout,
+                stderr=sys.stderr,
             )
-            if result.returncode == 0:
-                # タグの場合
-                subprocess.run(
-                    ["git", "reset", "--hard", ref],
-                    cwd=target_dir,
-                    check=True,
-                    stdin=subprocess.DEVNULL,
-                    stdout=sys.stdout,
-                    stderr=sys.stderr,
-                )
-            else:
-                # ブランチの場合
-                subprocess.run(
-                    ["git", "reset", "--hard", f"origin/{ref}"],
-                    cwd=target_dir,
-                    check=True,
-                    stdin=subprocess.DEVNULL,
-                    stdout=sys.stdout,
-                    stderr=sys.stderr,
-                )
 
             # fetch後のHEAD commit idを取得
+            new_commit_id = self._read_head_commit_id(target_dir)
+            if old_commit_id == new_commit_id:
+                return False
+
+            # commit idが変化していても、ファイルの内容（tree）が同一であれば再インデックスは不要
             result = subprocess.run(
-                ["git", "rev-parse", "HEAD"],
+                ["git", "rev-parse", f"{old_commit_id}^{{tree}}", f"{new_commit_id}^{{tree}}"],
                 cwd=target_dir,
-                check=True,
                 stdin=subprocess.DEVNULL,
                 stdout=subprocess.PIPE,
-                stderr=sys.stderr,
+                stderr=subprocess.DEVNULL,
                 text=True,
             )
-            new_commit_id = result.stdout.strip()
-
-            # commit idが変化していた場合はTrue、同一の場合はFalse
-            return old_commit_id != new_commit_id
+            tree_ids = result.stdout.split()
+            if result.returncode == 0 and len(tree_ids) == 2 and tree_ids[0] == tree_ids[1]:
+                logger.info("Commit changed but tree is unchanged", project_name=project.name,
+                            old_commit_id=old_commit_id, new_commit_id=new_commit_id)
+                return False
+            return True
         else:
             # 既存ディレクトリがない場合: git clone
-            if target_dir.exists():
-                shutil.rmtree(target_dir)
+            if state.exists:
+                self._remove_dir(target_dir)
 
             clone_cmd = ["git", "clone"]
-            if git_spec.depth is not None:
-                clone_cmd.extend(["--depth", str(git_spec.depth)])
+            if use_mirror:
+                # ミラーからオブジェクトをコピーし、ミラーへの依存は残さない
+                mirror_path = self.git_mirror_cache.ensure(git_spec.url)
+                clone_cmd.extend(["--reference", str(mirror_path), "--dissociate"])
+            if depth is not None:
+                clone_cmd.extend(["--depth", str(depth)])
             if git_spec.ref:
-                clone_cmd.extend(["--branch", git_spec.ref])
+                clone_cmd.extend(["--branch", git_spec.ref, "--single-branch"])
             clone_cmd.extend([git_spec.url, str(target_dir)])
 
             subprocess.run(
@@ -296,7 +723,59 @@ class SourceCodeDownloader:
             # 新規クローンの場合は常にTrue
             return True
 
-    def _download_archive(self, project: Project, target_dir: pathlib.Path) -> bool:
+    def _remote_ref_candidates(self, ref: str) -> list[str]:
+        """git fetch origin <ref>が解決するrefの候補を優先順に返す"""
+        if ref == "HEAD" or ref.startswith("refs/"):
+            return [ref]
+        return [f"refs/tags/{ref}", f"refs/heads/{ref}"]
+
+    def _resolve_remote_ref(self, remote_refs: dict[str, str], candidate_refs: list[str]) -> typing.Optional[str]:
+        """ls-remoteの結果から、最初に見つかった候補のcommit idを返す"""
+        for name in candidate_refs:
+            # 注釈付きタグの場合は、参照先commit（^{}）を使う
+            commit_id = remote_refs.get(f"{name}^{{}}") or remote_refs.get(name)
+            if commit_id is not None:
+                return commit_id
+        return None
+
+    def _read_head_commit_id(self, repo_dir: pathlib.Path) -> str:
+        """HEADのcommit idを取得
+
+        gitコマンドを起動するコストを避けるため、.git/HEADとrefファイルを直接読み込む。
+        読み込めない形式の場合はgit rev-parseで取得する。
+        """
+        git_dir = repo_dir / ".git"
+        try:
+            head = (git_dir / "HEAD").read_text().strip()
+            if not head.startswith("ref: "):
+                # detached HEAD
+                return head
+            ref_name = head.removeprefix("ref: ")
+            ref_path = git_dir / ref_name
+            if ref_path.is_file():
+                return ref_path.read_text().strip()
+            with open(git_dir / "packed-refs") as f:
+                for line in f:
+                    if line.startswith(("#", "^")):
+                        continue
+                    commit_id, _, name = line.rstrip("\n").partition(" ")
+                    if name == ref_name:
+                        return commit_id
+        except OSError:
+            pass
+
+        result = subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=repo_dir,
+            check=True,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=sys.stderr,
+            text=True,
+        )
+        return result.stdout.strip()
+
+    def _download_archive(self, project: Project, target_dir: pathlib.Path, state: DirectoryState) -> bool:
         """アーカイブ形式でソースコードをダウンロード
         
         Returns:
@@ -306,6 +785,27 @@ class SourceCodeDownloader:
         if archive_spec is None:
             raise ValueError(f"Project {project.name} has no archive specification")
 
+        # 既存ディレクトリがある場合、以前のProject情報と比較
+        if state.exists:
+            old_project = self.json_manager.load_project(project.name)
+            if old_project is not None and old_project.archive == archive_spec:
+                # 一致する場合: 何もしない
+                return False
+            # 異なる場合: ディレクトリを削除
+            self._remove_dir(target_dir)
+
+        self._extract_archive(project.name, archive_spec, target_dir)
+
+        # ダウンロード/再ダウンロードが実行された場合はTrue
+        return True
+
+    def _extract_archive(self, project_name: str, archive_spec: ArchiveFileSpec, target_dir: pathlib.Path,
+                         strip_components: int = 0):
+        """アーカイブファイルをダウンロードしてtarget_dirに展開
+
+        Args:
+            strip_components: 展開時に取り除く先頭のディレクトリの階層数（TAR形式のみ対応）
+        """
         # 拡張子を判定
         extension = archive_spec.extension
         if extension is None:
@@ -324,53 +824,61 @@ class SourceCodeDownloader:
         extension = extension.lstrip(".")
         extension_lower = extension.lower()
 
-        # 既存ディレクトリがある場合、以前のProject情報と比較
-        if target_dir.exists():
-            old_project = self.json_manager.load_project(project.name)
-            if old_project is not None and old_project.archive == archive_spec:
-                # 一致する場合: 何もしない
-                return False
-            # 異なる場合: ディレクトリを削除
-            shutil.rmtree(target_dir)
-
-        # HTTPダウンロード
-        response = requests.get(archive_spec.url, stream=True)
-        response.raise_for_status()
+        is_tar = extension_lower == "tar" or extension_lower.startswith("tar.")
+        if strip_components and not is_tar:
+            raise ValueError(f"strip_components is not supported for archive format: {extension}")
+        tar_options = [f"--strip-components={strip_components}"] if strip_components else []
 
-        # data_dirに保存（${data_dir}/${project_name}/archive.${extension}）
-        archive_dir = self.data_dir / project.name
-        archive_dir.mkdir(parents=True, exist_ok=True)
+        # ストリーム展開できない形式は、data_dirに保存してから展開する
+        # （${data_dir}/${project_name}/archive.${extension}）
+        archive_dir = self.data_dir / project_name
         archive_path = archive_dir / f"archive.{extension}"
 
         try:
-            # アーカイブファイルをダウンロード
+            target_dir.mkdir(parents=True, exist_ok=True)
+
+            if extension_lower == "tar.zst" and zstandard is not None and not strip_components:
+                # zstdはプロセス内で展開する（zstdコマンドが不要）
+                response = self.session.get(archive_spec.url, stream=True)
+                response.raise_for_status()
+                self._extract_tar_zst_stream(response, target_dir, archive_spec.digest)
+                return
+
+            if extension_lower in TAR_COMPRESSION_OPTIONS:
+                # TAR形式はダウンロードしながら展開する（一時ファイルを作成しない）
+                response = self.session.get(archive_spec.url, stream=True)
+                response.raise_for_status()
+                self._extract_tar_stream(
+                    response, [*TAR_COMPRESSION_OPTIONS[extension_lower], *tar_options], target_dir,
+                    archive_spec.digest,
+                )
+                return
+
+            # アーカイブファイルをダウンロード（ハッシュ値もダウンロードしながら計算する）
+            response = self.session.get(archive_spec.url, stream=True)
+            response.raise_for_status()
+            archive_dir.mkdir(parents=True, exist_ok=True)
+            hash_obj = self._new_hash(archive_spec.digest)
             with open(archive_path, "wb") as archive_file:
-                for chunk in response.iter_content(chunk_size=8192):
+                for chunk in response.iter_content(chunk_size=1 << 20):
+                    if hash_obj is not None:
+                        hash_obj.update(chunk)
                     archive_file.write(chunk)
                 archive_file.flush()
 
             # ハッシュ検証
-            if archive_spec.digest is not None:
-                self._verify_hash(archive_path, archive_spec.digest)
+            self._check_hash(hash_obj, archive_spec.digest)
 
             # アーカイブ展開
-            target_dir.mkdir(parents=True, exist_ok=True)
-
             if extension_lower == "zip":
-                # ZIP形式で展開（unzipコマンドを使用）
-                result = subprocess.run(
-                    ["unzip", "-q", str(archive_path), "-d", str(target_dir)],
-                    check=True,
-                    stdin=subprocess.DEVNULL,
-                    stdout=sys.stdout,
-                    stderr=sys.stderr,
-                )
-            elif extension_lower == "tar" or extension_lower.startswith("tar."):
-                # TAR形式で展開（.tar, .tar.gz, .tar.bz2, .tar.xz, .tar.zstなど）
+                # ZIP形式で展開（zipfileでプロセス内で展開する）
+                self._extract_zip(archive_path, target_dir)
+            elif is_tar:
+                # TAR形式で展開（TAR_COMPRESSION_OPTIONSにない圧縮形式）
                 # tar axfで自動的に圧縮形式を検出して展開
                 try:
                     subprocess.run(
-                        ["tar", "axf", str(archive_path), "-C", str(target_dir)],
+                        ["tar", "axf", str(archive_path), *tar_options, "-C", str(target_dir)],
                         check=True,
                         stdin=subprocess.DEVNULL,
                         stdout=sys.stdout,
@@ -386,19 +894,144 @@ class SourceCodeDownloader:
             # エラーが発生した場合は、不正になっていると思われるデータを削除
             archive_path.unlink(missing_ok=True)
             if target_dir.exists():
-                shutil.rmtree(target_dir)
-            logger.error("Failed to download and extract archive file", project_name=project.name)
+                self._remove_dir(target_dir)
+            logger.error("Failed to download and extract archive file", project_name=project_name)
             raise
 
-        # ダウンロード/再ダウンロードが実行された場合はTrue
-        return True
+    def _extract_tar_stream(self, response: requests.Response, tar_options: list[str],
+                            target_dir: pathlib.Path, digest: typing.Optional[HashSpec]):
+        """HTTPレスポンスをtarコマンドに直接流し込んで展開
+
+        digestが指定されている場合は、展開と同時にハッシュ値を計算して検証する。
+        """
+        hash_obj = self._new_hash(digest)
+        # 標準入力から読む場合は圧縮形式を自動検出できないため、明示的に指定する
+        proc = subprocess.Popen(
+            ["tar", "xf", "-", *tar_options, "-C", str(target_dir)],
+            bufsize=0,
+            stdin=subprocess.PIPE,
+            stdout=sys.stdout,
+            stderr=sys.stderr,
+        )
+        try:
+            for chunk in response.iter_content(chunk_size=1 << 20):
+                if hash_obj is not None:
+                    hash_obj.update(chunk)
+                proc.stdin.write(chunk)
+        except BrokenPipeError:
+            # tarが途中で終了した場合は、終了コードで判定する
+            pass
+        except Exception:
+            proc.kill()
+            raise
+        finally:
+            proc.stdin.close()
+            returncode = proc.wait()
+
+        if returncode != 0:
+            raise ValueError(f"Failed to extract archive file. tar exited with code {returncode}")
+        self._check_hash(hash_obj, digest)
+
+    def _extract_tar_zst_stream(self, response: requests.Response, target_dir: pathlib.Path,
+                                digest: typing.Optional[HashSpec]):
+        """HTTPレスポンスをzstandardで伸長しながら、tarfileで展開"""
+        hash_obj = self._new_hash(digest)
+        reader = io.BufferedReader(ResponseReader(response, hash_obj), buffer_size=1 << 20)
+        dctx = zstandard.ZstdDecompressor(max_window_size=2 ** 31)
+        with dctx.stream_reader(reader, closefd=False) as decompressed:
+            with tarfile.open(fileobj=decompressed, mode="r|") as tar:
+                # tarコマンドと同様に、展開先の外に書き込むエントリは拒否する
+                tar.extractall(target_dir, filter="tar")
+        # ハッシュ値を計算するため、展開に使われなかった末尾のデータも読み切る
+        while reader.read(1 << 20):
+            pass
+        self._check_hash(hash_obj, digest)
+
+    def _extract_zip(self, archive_path: pathlib.Path, target_dir: pathlib.Path):
+        """ZIPファイルを展開
+
+        ZipFile.extractallはシンボリックリンクを通常のファイルとして書き出し、パーミッションも復元しないため、
+        unzipと同様にUnixで作成されたエントリのシンボリックリンクとパーミッションを復元する。
+        """
+        symlinks = []
+        modes = []
+        with zipfile.ZipFile(archive_path) as zf:
+            for info in zf.infolist():
+                # パスの正規化（ディレクトリトラバーサル対策）はzipfileに任せる
+                path = zf.extract(info, target_dir)
+                if info.create_system != 3:
+                    # Unix以外で作成されたエントリには、パーミッションの情報がない
+                    continue
+                mode = info.external_attr >> 16
+                if stat.S_ISLNK(mode):
+                    symlinks.append((path, os.fsdecode(zf.read(info))))
+                elif stat.S_IMODE(mode):
+                    modes.append((path, stat.S_IMODE(mode) & 0o777))
+
+        # 展開中にシンボリックリンクを経由して書き込まないように、すべて展開してからリンクを作成する
+        for path, link_target in symlinks:
+            os.unlink(path)
+            os.symlink(link_target, path)
+        # 書き込み権限のないディレクトリにも展開できるように、パーミッションは最後に変更する
+        for path, mode in reversed(modes):
+            os.chmod(path, mode)
+
+    def _try_snapshot_url(self, git_spec: GitSpec) -> typing.Optional[ArchiveFileSpec]:
+        """固定されたrefのスナップショットをダウンロードできる場合は、そのアーカイブ情報を返す
+
+        refがcommit idまたはタグの場合のみ対象とする。ブランチは内容が変化するため対象外。
+        タグかどうかを確認するgit ls-remoteが失敗した場合は、例外を送出する。
+        スナップショットは<repo>-<ref>/ディレクトリ以下に格納されているため、
+        git cloneと同じ構成になるように展開時に先頭のディレクトリを取り除くこと。
+        """
+        if git_spec.ref is None:
+            return None
+        if git_spec.depth is not None:
+            # depthが明示されている場合は、履歴（OpenGrokの-H）が必要なためgit cloneする
+            return None
+        match = SNAPSHOT_HOST_PATTERN.match(git_spec.url)
+        if match is None:
+            return None
+
+        ref = git_spec.ref
+        is_tag = False
+        if not COMMIT_ID_PATTERN.match(ref):
+            # タグ名とブランチ名は区別できないため、リモートにタグが存在するか確認する
+            # 失敗した場合に「タグではない」と扱うと既存のディレクトリを削除してしまうため、エラーにする
+            result = subprocess.run(
+                ["git", "ls-remote", "--tags", git_spec.url, f"refs/tags/{ref}"],
+                check=True,
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.PIPE,
+                stderr=sys.stderr,
+                text=True,
+            )
+            remote_ref_names = {line.partition("\t")[2] for line in result.stdout.splitlines()}
+            if f"refs/tags/{ref}" not in remote_ref_names:
+                return None
+            is_tag = True
+
+        host, owner, repo = match.group("host", "owner", "repo")
+        if host == "github.com":
+            # 同名のブランチがあってもタグを取得するように、タグは完全な名前で指定する
+            github_ref = f"refs/tags/{ref}" if is_tag else ref
+            url = f"https://codeload.github.com/{owner}/{repo}/tar.gz/{github_ref}"
+        elif host == "gitlab.com":
+            url = f"https://gitlab.com/{owner}/{repo}/-/archive/{ref}/{repo}-{ref}.tar.gz"
+        else:
+            url = f"https://codeberg.org/{owner}/{repo}/archive/{ref}.tar.gz"
+        return ArchiveFileSpec(url=url, extension="tar.gz")
+
+    def _new_hash(self, digest: typing.Optional[HashSpec]) -> typing.Optional["hashlib._Hash"]:
+        """ハッシュ値の計算に使うオブジェクトを生成。digestが未指定の場合はNone"""
+        if digest is None:
+            return None
+        return hashlib.sha1() if digest.algorithm == "sha1" else hashlib.sha256()
 
-    def _verify_hash(self, file_path: pathlib.Path, digest: HashSpec):
-        """ファイルのハッシュ値を検証"""
-        hash_obj = hashlib.sha1() if digest.algorithm == "sha1" else hashlib.sha256()
-        with open(file_path, "rb") as f:
-            for chunk in iter(lambda: f.read(8192), b""):
-                hash_obj.update(chunk)
+    def _check_hash(self, hash_obj: typing.Optional["hashlib._Hash"], digest: typing.Optional[HashSpec]):
+        """計算したハッシュ値を検証"""
+        if hash_obj is None or digest is None:
+            return
         computed_hash = hash_obj.hexdigest()
         if computed_hash != digest.value:
             raise ValueError(
@@ -415,16 +1048,34 @@ class OpenGrokClient:
         self.data_dir = data_dir
         self.api_client = OpenGrokAPIClient(f"{base_uri}/api/v1")
         self.json_manager = ProjectJsonManager(data_dir, src_dir)
+        self.git_mirror_cache = GitMirrorCache(data_dir / ".git-cache")
+        self.downloader = SourceCodeDownloader(src_dir, data_dir, self.json_manager, self.git_mirror_cache)
+        # opengrok-projadmはOpenGrokのグローバル設定を書き換えるため、並列実行しないようにする
+        self._projadm_lock = threading.Lock()
+        # opengrok-indexerに渡す設定ファイルの一時ファイルと、その内容
+        self._config_tempfile: typing.Optional[pathlib.Path] = None
+        self._config_content: typing.Optional[bytes] = None
 
     def get_projects(self) -> dict[str, Project]:
         # OpenGrok APIからプロジェクト名のリストを取得
         project_names = self.api_client.get_project_names()
 
+        # 各プロジェクトの詳細メタデータをインデックスから読み込む
+        indexed_projects = self.json_manager.load_all()
+        loaded_projects = {name: indexed_projects.get(name) for name in project_names}
+
+        # インデックスにないプロジェクトはファイルから読み込む（IO待ちが主なので並列に読み込む）
+        missing_project_names = [name for name, project in loaded_projects.items() if project is None]
+        if missing_project_names:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=16) as executor:
+                loaded_projects.update(zip(
+                    missing_project_names,
+                    executor.map(self.json_manager.load_project, missing_project_names),
+                ))
+
         projects = {}
         invalid_project_names = set()
-        for project_name in project_names:
-            # 各プロジェクトの詳細メタデータをファイルから読み込む
-            project = self.json_manager.load_project(project_name)
+        for project_name, project in loaded_projects.items():
             if project is not None:
                 projects[project_name] = project
             else:
@@ -437,6 +1088,10 @@ class OpenGrokClient:
         return projects
 
     def add_project(self, project: Project):
+        with self._projadm_lock:
+            self._add_project(project)
+
+    def _add_project(self, project: Project):
         # https://github.com/oracle/opengrok/wiki/Per-project-management-and-workflow
         # opengrok-projadmコマンドでプロジェクトを追加
         cmd = [
@@ -456,53 +1111,65 @@ class OpenGrokClient:
 
         # 再生成したconfigをreload
         # 設定ファイルをAPIから取得して一時ファイルに保存
-        with tempfile.NamedTemporaryFile(mode='wb', delete=False, suffix='.xml') as tmp_file:
-            tmp_config_path = pathlib.Path(tmp_file.name)
-            try:
-                config_content = self.api_client.get_configuration()
-                tmp_file.write(config_content)
-                tmp_file.flush()
-
-                # opengrok-indexerを実行
-                cmd = [
-                    "opengrok-indexer",
-                    "--jar", "/opengrok/lib/opengrok.jar", "--",
-                    "-c", "/usr/local/bin/ctags",
-                    "-U", self.base_uri,
-                    "-R", str(tmp_config_path),
-                    "-H", project.name,
-                ]
-                subprocess.run(
-                    cmd,
-                    check=True,
-                    stdin=subprocess.DEVNULL,
-                    stdout=sys.stdout,
-                    stderr=sys.stderr,
-                )
+        tmp_config_path = self._write_configuration()
 
-                # opengrok-projadm --refreshを実行
-                cmd = [
-                    "opengrok-projadm",
-                    "--jar", "/opengrok/lib/opengrok.jar",
-                    "--base", "/opengrok/",
-                    "--uri", self.base_uri,
-                    "--refresh",
-                ]
-                subprocess.run(
-                    cmd,
-                    check=True,
-                    stdin=subprocess.DEVNULL,
-                    stdout=sys.stdout,
-                    stderr=sys.stderr,
-                )
-            finally:
-                tmp_config_path.unlink(missing_ok=True)
+        # opengrok-indexerを実行
+        cmd = [
+            "opengrok-indexer",
+            "--jar", "/opengrok/lib/opengrok.jar", "--",
+            "-c", "/usr/local/bin/ctags",
+            "-U", self.base_uri,
+            "-R", str(tmp_config_path),
+            "-H", project.name,
+        ]
+        subprocess.run(
+            cmd,
+            check=True,
+            stdin=subprocess.DEVNULL,
+            stdout=sys.stdout,
+            stderr=sys.stderr,
+        )
+
+        # opengrok-projadm --refreshを実行
+        cmd = [
+            "opengrok-projadm",
+            "--jar", "/opengrok/lib/opengrok.jar",
+            "--base", "/opengrok/",
+            "--uri", self.base_uri,
+            "--refresh",
+        ]
+        subprocess.run(
+            cmd,
+            check=True,
+            stdin=subprocess.DEVNULL,
+            stdout=sys.stdout,
+            stderr=sys.stderr,
+        )
 
         # プロジェクトのメタデータをファイルに保存
         self.json_manager.save_project(project)
 
-    def reindex_project(self, project: Project):
-        """プロジェクトのインデックスを再生成"""
+    def _write_configuration(self) -> pathlib.Path:
+        """設定ファイルをAPIから取得して一時ファイルに保存し、そのパスを返す
+
+        一時ファイルは実行中に使い回し、内容が変化した場合のみ書き換える。
+        """
+        config_content = self.api_client.get_configuration()
+        if self._config_tempfile is None:
+            fd, name = tempfile.mkstemp(suffix=".xml")
+            os.close(fd)
+            self._config_tempfile = pathlib.Path(name)
+        if config_content != self._config_content:
+            self._config_tempfile.write_bytes(config_content)
+            self._config_content = config_content
+        return self._config_tempfile
+
+    def reindex_project(self, project: Project, thread_budget: int):
+        """プロジェクトのインデックスを再生成
+
+        Args:
+            thread_budget: インデックス作成に使用するスレッド数
+        """
         cmd = [
             "opengrok-reindex-project",
             "-J=-Djava.util.logging.config.file=/opengrok/etc/logging.properties",
@@ -516,12 +1183,16 @@ class OpenGrokClient:
             # "-m", "10m",
             "-r", "dirbased",
             "--renamedHistory", "on",
-            "--threads", str(os.cpu_count() or 1),
+            "--threads", str(thread_budget),
         ]
         result = subprocess.run(cmd, stdin=subprocess.DEVNULL, stdout=sys.stdout, stderr=sys.stderr)
         result.check_returncode()
 
     def delete_project(self, project: Project):
+        with self._projadm_lock:
+            self._delete_project(project)
+
+    def _delete_project(self, project: Project):
         # opengrok-projadmコマンドでプロジェクトを削除
         cmd = [
             "opengrok-projadm",
@@ -547,8 +1218,71 @@ class OpenGrokClient:
         Returns:
             bool: 変更があった場合はTrue、変更がなかった場合はFalse
         """
-        downloader = SourceCodeDownloader(self.src_dir, self.data_dir, self.json_manager)
-        return downloader.download(project)
+        return self.downloader.download(project)
+
+    def close(self):
+        """保持しているHTTPセッションと一時ファイルを片付ける"""
+        self.api_client.close()
+        self.downloader.close()
+        if self._config_tempfile is not None:
+            self._config_tempfile.unlink(missing_ok=True)
+            self._config_tempfile = None
+            self._config_content = None
+
+    def __enter__(self) -> "OpenGrokClient":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+ProjectStatus = typing.Literal["unchanged", "updated", "failed"]
+
+
+def process_project(
+        client: OpenGrokClient,
+        name: str,
+        expected: Project,
+        actual: typing.Optional[Project],
+        reindex_retries: int,
+        thread_budget: int,
+) -> ProjectStatus:
+    """1つのプロジェクトについてダウンロード、追加、再インデックスを行う
+
+    Returns:
+        ProjectStatus: 処理結果
+    """
+    logger.info("Processing project", name=name, expected=expected, actual=actual)
+
+    need_recreate = expected != actual and actual is not None
+    if need_recreate:
+        client.delete_project(actual)
+        logger.info("Deleted project due to project.json mismatch", name=name)
+
+    try:
+        changed = client.download_source_code(expected)
+        if not changed:
+            logger.info("Project source code not changed", name=name)
+            return "unchanged"
+    except Exception as e:
+        logger.info("Failed to download source code", name=name, exception=str(e))
+        return "failed"
+
+    logger.info("Project source code changed", name=name)
+    if actual is None or need_recreate:
+        logger.info("Adding project", name=name)
+        client.add_project(expected)
+
+    logger.info("Reindexing project", name=name)
+    # NOTE: The opengrok-reindex-project command may fail with non-zero exit code. So we need to retry it.
+    reindex_project_retry = tenacity.retry(
+        retry=tenacity.retry_if_exception_type(subprocess.CalledProcessError),
+        stop=tenacity.stop_after_attempt(reindex_retries),
+        wait=tenacity.wait_exponential_jitter(max=60),
+    )(client.reindex_project)
+    reindex_project_retry(expected, thread_budget)  # type: ignore
+    logger.info("Reindexed project", name=name)
+    return "updated"
 
 
 def main():
@@ -559,58 +1293,61 @@ def main():
         default=3,
         help="Number of retries for reindex_project when it fails with subprocess.CalledProcessError",
     )
+    parser.add_argument(
+        "--jobs", "-j",
+        type=int,
+        default=1,
+        help="Number of projects to download and reindex in parallel",
+    )
     args = parser.parse_args()
+    if args.jobs < 1:
+        parser.error("--jobs must be greater than or equal to 1")
 
-    expected_projects = ProjectDefsJson.parse(sys.stdin.read())
+    # 複数のプロジェクトを並列にインデックスする場合は、CPUを過剰に割り当てないようにスレッド数を分配する
+    thread_budget = max(1, (os.cpu_count() or 1) // args.jobs)
+
+    expected_projects = ProjectDefsJson.parse(sys.stdin.buffer.read())
 
     # Directory layout:
     #  ${src_dir}/${project_name}/ - git worktree or content of archive file.
     #  ${data_dir}/${project_name}/project.json - project metadata.
-    #  ${data_dir}/${project_name}/archive.${extension} - archive file.
+    #  ${data_dir}/projects_index.json - metadata of all projects, kept in sync with project.json files.
+    #  ${data_dir}/${project_name}/archive.${extension} - archive file that cannot be extracted as a stream (e.g. zip).
+    #  ${data_dir}/.git-cache/${url_hash}.git - bare mirror of git repository shared by projects.
     src_dir = pathlib.Path("/opengrok/src")
     data_dir = pathlib.Path("/opengrok/manager_data")
-    client = OpenGrokClient('http://localhost:8080', src_dir, data_dir)
-    actual_projects = client.get_projects()
-    logger.info("get_projects", expected_projects=expected_projects, actual_projects=actual_projects)
-
-    extra_project_names = set(actual_projects.keys()) - set(expected_projects.keys())
-    for project_name in extra_project_names:
-        client.delete_project(actual_projects[project_name])
-        logger.info("Deleted project", name=project_name)
-
-    for name in expected_projects:
-        expected = expected_projects[name]
-        actual = actual_projects.get(name)
-        logger.info("Processing project", name=name, expected=expected, actual=actual)
-
-        need_recreate = expected != actual and actual is not None
-        if need_recreate:
-            client.delete_project(actual)
-            logger.info("Deleted project due to project.json mismatch", name=name)
-
-        try:
-            changed = client.download_source_code(expected)
-            if not changed:
-                logger.info("Project source code not changed", name=name)
-                continue
-        except Exception as e:
-            logger.info("Failed to download source code", name=name, exception=str(e))
-            continue
-
-        logger.info("Project source code changed", name=name)
-        if actual is None or need_recreate:
-            logger.info("Adding project", name=name)
-            client.add_project(expected)
-
-        logger.info("Reindexing project", name=name)
-        # NOTE: The opengrok-reindex-project command may fail with non-zero exit code. So we need to retry it.
-        reindex_project_retry = tenacity.retry(
-            retry=tenacity.retry_if_exception_type(subprocess.CalledProcessError),
-            stop=tenacity.stop_after_attempt(args.reindex_retries),
-            wait=tenacity.wait_exponential_jitter(max=60),
-        )(client.reindex_project)
-        reindex_project_retry(expected)  # type: ignore
-        logger.info("Reindexed project", name=name)
+    with OpenGrokClient('http://localhost:8080', src_dir, data_dir) as client:
+        actual_projects = client.get_projects()
+        logger.info("get_projects", expected_projects=expected_projects, actual_projects=actual_projects)
+
+        extra_project_names = set(actual_projects.keys()) - set(expected_projects.keys())
+        for project_name in extra_project_names:
+            client.delete_project(actual_projects[project_name])
+            logger.info("Deleted project", name=project_name)
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=args.jobs) as executor:
+            futures = {
+                executor.submit(
+                    process_project,
+                    client,
+                    name,
+                    expected_projects[name],
+                    actual_projects.get(name),
+                    args.reindex_retries,
+                    thread_budget,
+                ): name
+                for name in expected_projects
+            }
+            for future in concurrent.futures.as_completed(futures):
+                name = futures[future]
+                try:
+                    status = future.result()
+                except Exception:
+                    # 未処理のプロジェクトはキャンセルし、実行中のものは完了を待ってから例外を再送出する
+                    logger.exception("Failed to process project", name=name)
+                    executor.shutdown(wait=True, cancel_futures=True)
+                    raise
+                logger.info("Processed project", name=name, status=status)
 
 
 if __name__ == "__main__":